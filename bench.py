@@ -0,0 +1,202 @@
+import os, sys, json, time, random, argparse, tempfile, subprocess, tracemalloc
+from datetime import datetime, timedelta
+
+# Без окон: страницы рисуются в offscreen-платформе Qt
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtWidgets import QApplication
+import main
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+# Методы Database, время которых считается SQL-фазой
+QUERIES = ["products", "available_products", "orders", "report", "total", "margin"]
+
+# Страница, метод перерисовки
+PAGES = [
+    ("catalog", main.Catalog, "load"),
+    ("create_order", main.CreateOrder, "load_products"),
+    ("orders", main.OrderList, "load"),
+    ("report", main.Report, "load"),
+]
+
+def generate(path, n):
+    db = main.Database(path)
+    cats = db.categories()
+    today = datetime.now()
+    rnd = random.Random(n)
+    with db.conn:
+        db.conn.executemany("""
+        INSERT INTO products(name,category,quantity,price,article,description)
+        VALUES(?,?,?,?,?,?)
+        """, [(f"Товар {i}", cats[i % len(cats)], rnd.randint(1, 50),
+               rnd.randint(100, 5000), f"BENCH{i:06d}", "") for i in range(n)])
+        names = dict(db.fetch("SELECT id, name FROM products"))
+        pids = list(names)
+        rows = []
+        for i in range(n):
+            pid = rnd.choice(pids)
+            date = (today - timedelta(days=rnd.randint(0, 29))).strftime("%Y-%m-%d")
+            rows.append((pid, rnd.randint(1, 5), date, rnd.randint(100, 5000), names[pid]))
+        db.conn.executemany("INSERT INTO orders VALUES(NULL,?,?,?,'выполнен')",
+                            [r[:3] for r in rows])
+        db.conn.executemany("""
+        INSERT INTO sales(product_id,quantity,sale_date,price,product_name)
+        VALUES(?,?,?,?,?)
+        """, rows)
+    db.conn.close()
+    # Открываем заново, как при обычном запуске приложения
+    return main.Database(path)
+
+class QueryTimer:
+    def __init__(self, db):
+        self.spent = 0.0
+        for name in QUERIES:
+            setattr(db, name, self.wrap(getattr(db, name)))
+
+    def wrap(self, fn):
+        def timed(*a, **k):
+            t = time.perf_counter()
+            try:
+                return fn(*a, **k)
+            finally:
+                self.spent += time.perf_counter() - t
+        return timed
+
+def peak_rss_kb():
+    # Пиковый RSS процесса: на Windows через psapi, иначе getrusage
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class Counters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + \
+                       [(f, ctypes.c_size_t) for f in (
+                           "PeakWorkingSetSize", "WorkingSetSize",
+                           "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                           "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage",
+                           "PagefileUsage", "PeakPagefileUsage")]
+
+        k32, psapi = ctypes.windll.kernel32, ctypes.windll.psapi
+        k32.GetCurrentProcess.restype = wintypes.HANDLE
+        psapi.GetProcessMemoryInfo.argtypes = [
+            wintypes.HANDLE, ctypes.POINTER(Counters), wintypes.DWORD]
+        c = Counters()
+        c.cb = ctypes.sizeof(c)
+        psapi.GetProcessMemoryInfo(k32.GetCurrentProcess(), ctypes.byref(c), c.cb)
+        return c.PeakWorkingSetSize // 1024
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+def load_once(app, page, method):
+    t = time.perf_counter()
+    getattr(page, method)()
+    app.processEvents()  # раскладка и отрисовка таблицы
+    return time.perf_counter() - t
+
+def measure_page(path, name, repeat):
+    # Выполняется в отдельном процессе: пиковый RSS относится
+    # только к этой странице
+    cls, method = {n: (c, m) for n, c, m in PAGES}[name]
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    db = main.Database(path)
+    timer = QueryTimer(db)
+    page = cls(db, None)
+    page.resize(1000, 700)
+    page.show()
+    app.processEvents()
+
+    # Время — без tracemalloc, он замедляет выделение памяти
+    best = None
+    for _ in range(repeat):
+        timer.spent = 0.0
+        wall = load_once(app, page, method)
+        if best is None or wall < best[0]:
+            best = (wall, timer.spent)
+
+    # Память — отдельным проходом
+    tracemalloc.start()
+    load_once(app, page, method)
+    py_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "total": best[0],
+        "query": best[1],
+        "render": best[0] - best[1],
+        "py_peak_kb": py_peak // 1024,
+        "peak_rss_kb": peak_rss_kb(),
+    }
+
+def run(sizes, repeat):
+    results = {}
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            generate(path, n).conn.close()
+            for name, _, _ in PAGES:
+                out = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--page", name,
+                     "--db", path, "--repeat", str(repeat)],
+                    capture_output=True, text=True, check=True).stdout
+                results[f"{name}/{n}"] = json.loads(out.strip().splitlines()[-1])
+    return results
+
+def compare(results, baseline, tolerance, min_ms):
+    # Регрессия: время или память выросли больше допуска;
+    # разницу во времени меньше min_ms считаем шумом
+    failed = []
+    for key, r in results.items():
+        b = baseline.get(key)
+        if not b:
+            continue
+        if r["total"] > b["total"] * (1 + tolerance) and \
+                (r["total"] - b["total"]) * 1000 > min_ms:
+            failed.append(f"{key}: время {b['total']:.3f} -> {r['total']:.3f} с")
+        for field in ("py_peak_kb", "peak_rss_kb"):
+            if field in b and r[field] > b[field] * (1 + tolerance):
+                failed.append(f"{key}: {field} {b[field]} -> {r[field]} КБ")
+    return failed
+
+def main_bench():
+    ap = argparse.ArgumentParser(description="Замер отрисовки страниц без окна")
+    ap.add_argument("--sizes", default="1000,10000,100000")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--baseline", default=BASELINE)
+    ap.add_argument("--save", action="store_true", help="записать результат как эталон")
+    ap.add_argument("--tolerance", type=float, default=0.25)
+    ap.add_argument("--min-ms", type=float, default=5)
+    ap.add_argument("--page", help=argparse.SUPPRESS)  # дочерний процесс
+    ap.add_argument("--db", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.page:
+        print(json.dumps(measure_page(args.db, args.page, args.repeat)))
+        return 0
+
+    results = run([int(x) for x in args.sizes.split(",")], args.repeat)
+
+    print(f"{'страница/строк':<22}{'всего, с':>10}{'SQL, с':>10}{'Qt, с':>10}"
+          f"{'py пик, КБ':>12}{'RSS пик, КБ':>13}")
+    for key, r in results.items():
+        print(f"{key:<22}{r['total']:>10.3f}{r['query']:>10.3f}{r['render']:>10.3f}"
+              f"{r['py_peak_kb']:>12}{r['peak_rss_kb']:>13}")
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Эталон сохранён: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("Эталона нет, сравнение пропущено (запустите с --save)")
+        return 0
+    with open(args.baseline) as f:
+        failed = compare(results, json.load(f), args.tolerance, args.min_ms)
+    for line in failed:
+        print("РЕГРЕССИЯ", line)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main_bench())
@@ -1,10 +1,16 @@
-import sys, sqlite3
+import sys, os, csv, glob, sqlite3
 from datetime import datetime
 from PyQt6.QtWidgets import *
 from PyQt6.QtCore import *
 from PyQt6.QtGui import *
 
 DB = "shop.db"
+BACKUP_DIR = "backups"
+SNAPSHOT_KEEP = 7
+SNAPSHOT_INTERVAL = 24 * 60 * 60 * 1000  # мс, раз в сутки
+ARCHIVE_BATCH = 500
+POLL_INTERVAL = 1000  # мс, проверка изменений из других процессов
+CLOSED_STATUSES = ("выполнен", "отменен")
 
 STYLE = """
 QMainWindow { background: #121212; color: white; }
@@ -99,10 +105,35 @@ QPushButton#navButton.active {
 }
 """
 
+class DbEvents(QObject):
+    product_changed = pyqtSignal(int)
+    product_removed = pyqtSignal(int)
+    product_renamed = pyqtSignal(int)  # название или артикул
+    order_added = pyqtSignal(int)
+    order_changed = pyqtSignal(int)
+    sale_added = pyqtSignal(int)
+    reloaded = pyqtSignal()  # изменения, которые не разобрать точечно (архив)
+
 class Database:
-    def __init__(self):
-        self.conn = sqlite3.connect(DB)
+    def __init__(self, path=DB):
+        self.path = path
+        self.archive_path = os.path.splitext(path)[0] + "_archive.db"
+        self.events = DbEvents()
+        self.own = set()  # (таблица, id) записей этого соединения
+        self.conn = sqlite3.connect(path)
+        # WAL: снимки, проверка и копирование читают базу,
+        # не блокируя запись заказов
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.attach(self.conn)
+        self.conn.execute("PRAGMA archive.journal_mode=WAL")
         self.init()
+        self.build_codes()
+        self.version = self.data_version()
+        self.marks = self.high_water()
+        self.own.clear()
+
+    def attach(self, conn):
+        conn.execute("ATTACH DATABASE ? AS archive", (self.archive_path,))
 
     def init(self):
         c = self.conn.cursor()
@@ -112,7 +143,7 @@ class Database:
             name TEXT UNIQUE
         );
         CREATE TABLE IF NOT EXISTS products(
-            id INTEGER PRIMARY KEY,
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT,
             category TEXT,
             quantity INTEGER,
@@ -121,22 +152,163 @@ class Database:
             description TEXT
         );
         CREATE TABLE IF NOT EXISTS orders(
-            id INTEGER PRIMARY KEY,
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
             product_id INTEGER,
             quantity INTEGER,
             order_date TEXT,
             status TEXT
         );
         CREATE TABLE IF NOT EXISTS sales(
-            id INTEGER PRIMARY KEY,
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
             product_id INTEGER,
             quantity INTEGER,
             sale_date TEXT,
-            price REAL
+            price REAL,
+            product_name TEXT,
+            article TEXT,
+            category TEXT
         );
+        CREATE TABLE IF NOT EXISTS price_history(
+            id INTEGER PRIMARY KEY,
+            product_id INTEGER,
+            price REAL,
+            cost REAL,
+            effective_from TEXT,
+            UNIQUE(product_id, effective_from)
+        );
+        CREATE TABLE IF NOT EXISTS stock_movements(
+            id INTEGER PRIMARY KEY,
+            product_id INTEGER,
+            delta INTEGER,
+            reason TEXT,
+            ref INTEGER,
+            moved_at TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_movements
+        ON stock_movements(product_id, id, moved_at, delta);
+        CREATE TABLE IF NOT EXISTS stock_snapshots(
+            product_id INTEGER,
+            movement_id INTEGER,
+            balance INTEGER,
+            taken_at TEXT,
+            PRIMARY KEY(product_id, movement_id)
+        );
+        CREATE TABLE IF NOT EXISTS changes(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT,
+            ref INTEGER,
+            changed_at TEXT
+        );
+        DELETE FROM changes WHERE changed_at < datetime('now', 'localtime', '-1 day');
         """)
         self.conn.commit()
+        self.migrate()
+        self.init_archive()
         self.seed()
+        self.init_prices()
+        self.init_stock()
+
+    def init_stock(self):
+        # Текущие остатки без истории записываем начальным движением
+        self.exec("""
+        INSERT INTO stock_movements(product_id, delta, reason, moved_at)
+        SELECT id, quantity, 'остаток', datetime('now', 'localtime') FROM products
+        WHERE id NOT IN (SELECT product_id FROM stock_movements)
+        """)
+        self.snapshot_stock()
+
+    def init_prices(self):
+        # Товары без истории получают начальную цену "с начала времён"
+        self.exec("""
+        INSERT INTO price_history(product_id, price, effective_from)
+        SELECT id, price, '0000-01-01' FROM products
+        WHERE id NOT IN (SELECT product_id FROM price_history)
+        """)
+        self.today = None
+        self.apply_prices()
+
+    def init_archive(self):
+        # Архив повторяет схему горячих таблиц
+        c = self.conn.cursor()
+        for table in ("orders", "sales"):
+            sql = self.fetch(
+                "SELECT sql FROM main.sqlite_master WHERE type='table' AND name=?",
+                (table,))[0][0]
+            c.execute(sql.replace(f"CREATE TABLE {table}",
+                                  f"CREATE TABLE IF NOT EXISTS archive.{table}", 1))
+        c.execute("""
+        CREATE INDEX IF NOT EXISTS archive.idx_sales_report
+        ON sales(sale_date, product_name, quantity, price)
+        """)
+        self.conn.commit()
+
+    def columns(self, table):
+        return [r[1] for r in self.fetch(f"PRAGMA table_info({table})")]
+
+    def migrate(self):
+        # Старые базы: добавляем снимок товара в продажи и заполняем его
+        cols = self.columns("sales")
+        c = self.conn.cursor()
+        if "product_name" not in cols:
+            for col in ("product_name", "article", "category"):
+                c.execute(f"ALTER TABLE sales ADD COLUMN {col} TEXT")
+            # Заполняем один раз, при добавлении колонок
+            c.execute("""
+            UPDATE sales SET
+                product_name=(SELECT name FROM products WHERE id=sales.product_id),
+                article=(SELECT article FROM products WHERE id=sales.product_id),
+                category=(SELECT category FROM products WHERE id=sales.product_id)
+            """)
+        # Id заказов и продаж не должны повторять уже ушедшие в архив
+        for table in ("orders", "sales"):
+            floor = 0
+            if self.fetch("SELECT 1 FROM archive.sqlite_master WHERE name=?", (table,)):
+                floor = self.fetch(f"SELECT COALESCE(MAX(id), 0) FROM archive.{table}")[0][0]
+            self.autoincrement(table, floor)
+        # Id удалённого товара не должен достаться новому: иначе тот
+        # унаследует его цены, движения и заказы
+        refs = [f"SELECT MAX(product_id) FROM main.{t}" for t in
+                ("orders", "sales", "price_history", "stock_movements", "stock_snapshots")]
+        refs += [f"SELECT MAX(product_id) FROM archive.{t}" for t in ("orders", "sales")
+                 if self.fetch("SELECT 1 FROM archive.sqlite_master WHERE name=?", (t,))]
+        self.autoincrement("products", max(
+            self.fetch(q)[0][0] or 0 for q in refs))
+        # Покрывающий индекс: отчёт читается только из индекса
+        c.execute("""
+        CREATE INDEX IF NOT EXISTS idx_sales_report
+        ON sales(sale_date, product_name, quantity, price)
+        """)
+        # Штрихкод товара, пустой хранится как NULL
+        if "barcode" not in self.columns("products"):
+            c.execute("ALTER TABLE products ADD COLUMN barcode TEXT")
+        c.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_products_barcode
+        ON products(barcode)
+        """)
+        self.conn.commit()
+
+    def autoincrement(self, table, floor=0):
+        # Без AUTOINCREMENT SQLite выдаёт удалённые id повторно,
+        # старые таблицы пересоздаём
+        sql = self.fetch(
+            "SELECT sql FROM main.sqlite_master WHERE type='table' AND name=?",
+            (table,))[0][0]
+        c = self.conn.cursor()
+        if "AUTOINCREMENT" not in sql:
+            c.execute(f"ALTER TABLE main.{table} RENAME TO {table}_old")
+            c.execute(sql.replace("id INTEGER PRIMARY KEY",
+                                  "id INTEGER PRIMARY KEY AUTOINCREMENT", 1))
+            c.execute(f"INSERT INTO main.{table} SELECT * FROM main.{table}_old")
+            c.execute(f"DROP TABLE main.{table}_old")
+        # Счётчик не ниже любого уже выданного id
+        seq = max(floor, self.fetch(f"SELECT COALESCE(MAX(id), 0) FROM main.{table}")[0][0])
+        if self.fetch("SELECT 1 FROM main.sqlite_sequence WHERE name=?", (table,)):
+            c.execute("UPDATE main.sqlite_sequence SET seq=MAX(seq, ?) WHERE name=?",
+                      (seq, table))
+        else:
+            c.execute("INSERT INTO main.sqlite_sequence(name, seq) VALUES(?, ?)",
+                      (table, seq))
+        self.conn.commit()
 
     def seed(self):
         c = self.conn.cursor()
@@ -165,8 +337,102 @@ class Database:
         return self.conn.cursor().execute(q, a).fetchall()
 
     def exec(self, q, a=()):
-        self.conn.cursor().execute(q, a)
+        c = self.conn.cursor()
+        c.execute(q, a)
         self.conn.commit()
+        return c.lastrowid
+
+    def data_version(self):
+        return (self.fetch("PRAGMA main.data_version")[0][0],
+                self.fetch("PRAGMA archive.data_version")[0][0])
+
+    # Новые строки этих таблиц превращаются в точечные события
+    def high_water(self):
+        return {t: self.fetch(f"SELECT COALESCE(MAX(id), 0) FROM main.{t}")[0][0]
+                for t in ("orders", "sales", "stock_movements", "changes")}
+
+    def log(self, c, kind, ref):
+        # Журнал правок, которые не добавляют строк: статус заказа,
+        # карточка товара, цена. Нужен другим кассам
+        c.execute("""
+        INSERT INTO changes(kind, ref, changed_at)
+        VALUES(?,?,datetime('now', 'localtime'))
+        """, (kind, ref))
+        self.own.add(("changes", c.lastrowid))
+
+    def new_rows(self, table, cols, old):
+        rows = self.fetch(f"SELECT id, {cols} FROM main.{table} WHERE id>? ORDER BY id", (old,))
+        return [r[1:] for r in rows if (table, r[0]) not in self.own]
+
+    def poll(self):
+        # data_version меняется только от коммитов других соединений
+        v = self.data_version()
+        if v != self.version:
+            archived = v[1] != self.version[1]
+            self.version = v
+            marks = self.high_water()
+            if archived or any(marks[t] < self.marks[t] for t in marks):
+                # Строки ушли в архив или удалены — точечно не разобрать
+                self.build_codes()
+                self.events.reloaded.emit()
+            else:
+                self.emit_new(marks)
+            self.marks = marks
+            self.own.clear()
+        self.apply_prices()
+
+    def emit_new(self, marks):
+        old = self.marks
+        products, renamed = set(), set()
+        for (pid,) in self.new_rows("stock_movements", "product_id", old["stock_movements"]):
+            products.add(pid)
+        for kind, ref in self.new_rows("changes", "kind, ref", old["changes"]):
+            if kind == "order":
+                self.events.order_changed.emit(ref)
+            else:
+                products.add(ref)
+                renamed.add(ref)
+        for pid in products:
+            self.index_product(pid)
+            if self.product_by_id(pid):
+                self.events.product_changed.emit(pid)
+            else:
+                self.events.product_removed.emit(pid)
+        for pid in renamed:
+            self.events.product_renamed.emit(pid)
+        for (oid,) in self.new_rows("orders", "id", old["orders"]):
+            self.events.order_added.emit(oid)
+        for (sid,) in self.new_rows("sales", "id", old["sales"]):
+            self.events.sale_added.emit(sid)
+
+    # Индекс артикулов и штрихкодов в памяти для сканера
+    def build_codes(self):
+        self.codes = {}  # код -> id товара
+        self.keys = {}   # id товара -> его коды
+        for pid, *keys in self.fetch("SELECT id, article, barcode FROM products"):
+            self.keys[pid] = [k for k in keys if k]
+            for k in self.keys[pid]:
+                self.codes[k] = pid
+
+    def index_product(self, pid):
+        for k in self.keys.pop(pid, ()):
+            if self.codes.get(k) == pid:
+                del self.codes[k]
+        for row in self.fetch("SELECT article, barcode FROM products WHERE id=?", (pid,)):
+            self.keys[pid] = [k for k in row if k]
+            for k in self.keys[pid]:
+                self.codes[k] = pid
+
+    def lookup(self, code):
+        return self.codes.get(code.strip())
+
+    def code_conflict(self, pid, codes):
+        # Артикулы и штрихкоды разных товаров не должны совпадать
+        for k in codes:
+            owner = self.codes.get(k) if k else None
+            if owner is not None and owner != pid:
+                return k
+        return None
 
     def products(self, key=""):
         if not key:
@@ -185,62 +451,296 @@ class Database:
         return result[0] if result else None
 
     def add_product(self, d):
-        self.exec("""
-        INSERT INTO products(name,article,category,quantity,price,description)
-        VALUES(?,?,?,?,?,?)
-        """, d)
+        with self.conn:
+            c = self.conn.cursor()
+            pid = c.execute("""
+            INSERT INTO products(name,article,category,quantity,price,description,barcode)
+            VALUES(?,?,?,?,?,?,?)
+            """, d).lastrowid
+            self.move(c, pid, d[3], "приход")
+            self.log(c, "product", pid)
+        self.set_price(pid, d[4], "0000-01-01")
+        self.index_product(pid)
+        self.events.product_changed.emit(pid)
 
     def update_product(self, pid, d):
-        self.exec("""
-        UPDATE products SET
-        name=?, article=?, category=?, quantity=?, price=?, description=?
-        WHERE id=?
-        """, (*d, pid))
+        old = self.product_by_id(pid)
+        if old[4] != d[4]:
+            self.set_price(pid, d[4])
+        with self.conn:
+            c = self.conn.cursor()
+            c.execute("""
+            UPDATE products SET
+            name=?, article=?, category=?, quantity=?, price=?, description=?, barcode=?
+            WHERE id=?
+            """, (*d, pid))
+            self.move(c, pid, d[3] - old[3], "корректировка")
+            self.log(c, "product", pid)
+        self.index_product(pid)
+        self.events.product_changed.emit(pid)
+        if (old[1], old[5]) != (d[0], d[1]):
+            self.events.product_renamed.emit(pid)
 
     def delete_product(self, pid):
-        self.exec("DELETE FROM products WHERE id=?", (pid,))
+        old = self.product_by_id(pid)
+        with self.conn:
+            c = self.conn.cursor()
+            c.execute("DELETE FROM products WHERE id=?", (pid,))
+            if old:
+                self.move(c, pid, -old[3], "удаление")
+            self.log(c, "product", pid)
+        self.index_product(pid)
+        self.events.product_removed.emit(pid)
 
     def add_order(self, pid, qty):
         product = self.product_by_id(pid)
         if not product:
             raise ValueError("Товар не найден")
+        price = self.price(pid)
+        if price is None:
+            price = product[4]
         
         if qty > product[3]:
             raise ValueError(f"Недостаточно товара. Доступно: {product[3]}")
         
         date = datetime.now().strftime("%Y-%m-%d")
-        self.exec("INSERT INTO orders VALUES(NULL,?,?,?,?)",
-                  (pid, qty, date, "ожидает"))
-        self.exec("INSERT INTO sales VALUES(NULL,?,?,?,?)",
-                  (pid, qty, date, product[4]))
-        self.exec("UPDATE products SET quantity=quantity-? WHERE id=?",
-                  (qty, pid))
+        # Одна транзакция на заказ: быстрее при потоке сканов
+        with self.conn:
+            c = self.conn.cursor()
+            oid = c.execute("INSERT INTO orders VALUES(NULL,?,?,?,?)",
+                            (pid, qty, date, "ожидает")).lastrowid
+            sid = c.execute("""
+            INSERT INTO sales(product_id,quantity,sale_date,price,
+                              product_name,article,category)
+            VALUES(?,?,?,?,?,?,?)
+            """, (pid, qty, date, price, product[1], product[5], product[2])).lastrowid
+            c.execute("UPDATE products SET quantity=quantity-? WHERE id=?",
+                      (qty, pid))
+            self.move(c, pid, -qty, "продажа", oid)
+        self.own |= {("orders", oid), ("sales", sid)}
+        self.events.product_changed.emit(pid)
+        self.events.order_added.emit(oid)
+        self.events.sale_added.emit(sid)
         return True
 
-    def orders(self):
-        return self.fetch("""
+    def orders(self, oid=None):
+        where = "WHERE o.id=?" if oid else ""
+        return self.fetch(f"""
         SELECT o.id, p.article, p.name,
-               o.quantity, o.order_date, o.status
+               o.quantity, o.order_date, o.status, o.product_id
         FROM orders o
         LEFT JOIN products p ON p.id=o.product_id
+        {where}
         ORDER BY o.id DESC
-        """)
+        """, (oid,) if oid else ())
 
     def set_status(self, oid, s):
-        self.exec("UPDATE orders SET status=? WHERE id=?", (s, oid))
+        with self.conn:
+            c = self.conn.cursor()
+            c.execute("UPDATE orders SET status=? WHERE id=?", (s, oid))
+            self.log(c, "order", oid)
+        self.events.order_changed.emit(oid)
+
+    def sale(self, sid):
+        result = self.fetch("""
+        SELECT sale_date, product_name, quantity, price, quantity*price
+        FROM sales WHERE id=?
+        """, (sid,))
+        return result[0] if result else None
 
-    def report(self, s, e):
+    # Цены с датой начала действия. Поиск по уникальному индексу
+    # (product_id, effective_from): одна строка, без полного просмотра
+    def set_price(self, pid, price, date=None, cost=None):
+        self.schedule_prices([(pid, price, date, cost)])
+
+    def schedule_prices(self, rows):
+        today = datetime.now().strftime("%Y-%m-%d")
+        with self.conn:
+            self.conn.executemany("""
+            INSERT INTO price_history(product_id, price, effective_from, cost)
+            VALUES(?,?,?,?)
+            ON CONFLICT(product_id, effective_from) DO UPDATE SET
+                price=excluded.price, cost=COALESCE(excluded.cost, cost)
+            """, [(pid, price, date or today, cost) for pid, price, date, cost in rows])
+        self.today = None
+        self.apply_prices()
+
+    def import_prices(self, path):
+        # CSV поставщика: артикул;цена;дата начала (ГГГГ-ММ-ДД);закупочная цена.
+        # Пустая дата — с сегодняшнего дня. Любая ошибка отменяет весь импорт
+        rows, errors = [], []
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            for n, line in enumerate(csv.reader(f, delimiter=";"), 1):
+                if not line or not line[0].strip():
+                    continue
+                pid = self.lookup(line[0])
+                if pid is None:
+                    errors.append(f"строка {n}: неизвестный артикул {line[0].strip()}")
+                    continue
+                try:
+                    date = line[2].strip() if len(line) > 2 else ""
+                    if date:
+                        date = datetime.strptime(date, "%Y-%m-%d").strftime("%Y-%m-%d")
+                    # Excel с русской локалью пишет дробную часть через запятую
+                    cost = float(line[3].replace(",", ".")) \
+                        if len(line) > 3 and line[3].strip() else None
+                    rows.append((pid, float(line[1].replace(",", ".")), date or None, cost))
+                except (ValueError, IndexError):
+                    errors.append(f"строка {n}: неверная цена или дата")
+        if errors:
+            raise ValueError("\n".join(errors))
+        self.schedule_prices(rows)
+        return len(rows)
+
+    def price(self, pid, date=None):
+        r = self.fetch("""
+        SELECT price FROM price_history
+        WHERE product_id=? AND effective_from<=?
+        ORDER BY effective_from DESC LIMIT 1
+        """, (pid, date or datetime.now().strftime("%Y-%m-%d")))
+        return r[0][0] if r else None
+
+    def price_trend(self, pid, s, e):
+        # Цена на начало периода и все изменения внутри него
         return self.fetch("""
-        SELECT p.name, s.quantity, s.price, s.quantity*s.price
-        FROM sales s
-        LEFT JOIN products p ON p.id=s.product_id
-        WHERE s.sale_date BETWEEN ? AND ?
+        SELECT * FROM (
+            SELECT effective_from, price, cost FROM price_history
+            WHERE product_id=? AND effective_from<=?
+            ORDER BY effective_from DESC LIMIT 1
+        )
+        UNION ALL
+        SELECT effective_from, price, cost FROM price_history
+        WHERE product_id=? AND effective_from>? AND effective_from<=?
+        """, (pid, s, pid, s, e))
+
+    def apply_prices(self):
+        # products.price — кэш текущей цены для списков, обновляем
+        # при смене дня и после планирования новых цен
+        today = datetime.now().strftime("%Y-%m-%d")
+        if today == self.today:
+            return
+        self.today = today
+        current = """(SELECT h.price FROM price_history h
+            WHERE h.product_id=products.id AND h.effective_from<=?
+            ORDER BY h.effective_from DESC LIMIT 1)"""
+        rows = self.fetch(f"""
+        SELECT id FROM products
+        WHERE price IS NOT {current} AND {current} IS NOT NULL
+        """, (today, today))
+        if not rows:
+            return
+        with self.conn:
+            c = self.conn.cursor()
+            c.executemany(f"UPDATE products SET price={current} WHERE id=?",
+                          [(today, pid) for (pid,) in rows])
+            for (pid,) in rows:
+                self.log(c, "product", pid)
+        for (pid,) in rows:
+            self.events.product_changed.emit(pid)
+
+    def margin(self, s, e):
+        # Выручка минус закупка по цене, действовавшей на дату продажи
+        r = self.fetch(f"""
+        SELECT SUM(s.quantity * (s.price - (
+            SELECT h.cost FROM price_history h
+            WHERE h.product_id=s.product_id AND h.effective_from<=s.sale_date
+                  AND h.cost IS NOT NULL
+            ORDER BY h.effective_from DESC LIMIT 1)))
+        FROM {self.sales_source(s)} s WHERE s.sale_date BETWEEN ? AND ?
+        """, (s, e))[0][0]
+        return r or 0
+
+    # Журнал движения товара. Пишется в той же транзакции,
+    # что и изменение products.quantity
+    def move(self, c, pid, delta, reason, ref=None):
+        if delta:
+            c.execute("""
+            INSERT INTO stock_movements(product_id, delta, reason, ref, moved_at)
+            VALUES(?,?,?,?,datetime('now', 'localtime'))
+            """, (pid, delta, reason, ref))
+            self.own.add(("stock_movements", c.lastrowid))
+
+    def snapshot_stock(self):
+        # Фиксируем остаток по товарам, у которых были движения
+        # после последнего снимка
+        with self.conn:
+            self.conn.execute("""
+            INSERT INTO stock_snapshots(product_id, movement_id, balance, taken_at)
+            SELECT m.product_id, MAX(m.id),
+                   COALESCE(last.balance, 0) + SUM(m.delta), m.moved_at
+            FROM stock_movements m
+            LEFT JOIN stock_snapshots last
+                ON last.product_id=m.product_id
+               AND last.movement_id=(SELECT MAX(movement_id) FROM stock_snapshots
+                                     WHERE product_id=m.product_id)
+            WHERE m.id > COALESCE(last.movement_id, 0)
+            GROUP BY m.product_id
+            """)
+
+    def stock_at(self, pid, date):
+        # Остаток на конец дня: ближайший снимок + короткий хвост движений
+        end = self.fetch("SELECT datetime(?, '+1 day')", (date,))[0][0]
+        snap = self.fetch("""
+        SELECT movement_id, balance FROM stock_snapshots
+        WHERE product_id=? AND taken_at<?
+        ORDER BY movement_id DESC LIMIT 1
+        """, (pid, end))
+        mid, balance = snap[0] if snap else (0, 0)
+        tail = self.fetch("""
+        SELECT COALESCE(SUM(delta), 0) FROM stock_movements
+        WHERE product_id=? AND id>? AND moved_at<?
+        """, (pid, mid, end))[0][0]
+        return balance + tail
+
+    def movements(self, pid):
+        return self.fetch("""
+        SELECT moved_at, delta, reason, ref FROM stock_movements
+        WHERE product_id=? ORDER BY id DESC
+        """, (pid,))
+
+    def reconcile(self, progress=None):
+        # Сверка products.quantity с журналом, своё соединение для DbTask
+        conn = sqlite3.connect(self.path)
+        try:
+            rows = conn.execute("""
+            SELECT article, name, quantity, ledger FROM (
+                SELECT p.article, p.name, p.quantity,
+                       COALESCE(s.balance, 0) + COALESCE((
+                           SELECT SUM(delta) FROM stock_movements m
+                           WHERE m.product_id=p.id
+                             AND m.id > COALESCE(s.movement_id, 0)), 0) AS ledger
+                FROM products p
+                LEFT JOIN stock_snapshots s
+                    ON s.product_id=p.id
+                   AND s.movement_id=(SELECT MAX(movement_id) FROM stock_snapshots
+                                      WHERE product_id=p.id)
+            ) WHERE quantity IS NOT ledger
+            """).fetchall()
+        finally:
+            conn.close()
+        return rows
+
+    def sales_source(self, s):
+        # Архив подключаем к запросу, только если период его затрагивает
+        last = self.fetch("SELECT MAX(sale_date) FROM archive.sales")[0][0]
+        if last is None or s > last:
+            return "main.sales"
+        # Строка, оставшаяся после сбоя в обоих файлах, считается один раз
+        return """(SELECT * FROM main.sales
+                   WHERE id NOT IN (SELECT id FROM archive.sales)
+                   UNION ALL SELECT * FROM archive.sales)"""
+
+    def report(self, s, e):
+        return self.fetch(f"""
+        SELECT product_name, quantity, price, quantity*price
+        FROM {self.sales_source(s)}
+        WHERE sale_date BETWEEN ? AND ?
         """, (s, e))
 
     def total(self, s, e):
-        r = self.fetch("""
+        r = self.fetch(f"""
         SELECT SUM(quantity*price)
-        FROM sales WHERE sale_date BETWEEN ? AND ?
+        FROM {self.sales_source(s)} WHERE sale_date BETWEEN ? AND ?
         """, (s, e))[0][0]
         return r or 0
 
@@ -252,6 +752,132 @@ class Database:
     def add_category(self, name):
         self.exec("INSERT OR IGNORE INTO categories(name) VALUES(?)", (name,))
 
+    # Обслуживание. Методы открывают своё соединение,
+    # поэтому их можно вызывать из фонового потока (DbTask)
+    # Копия архива лежит рядом: shop-....db и shop-..._archive.db
+    def archive_of(self, path):
+        return os.path.splitext(path)[0] + "_archive.db"
+
+    def backup(self, dest, progress=None):
+        src = sqlite3.connect(self.path)
+        try:
+            self.attach(src)
+            for schema, path in (("main", dest), ("archive", self.archive_of(dest))):
+                dst = sqlite3.connect(path)
+                try:
+                    # Одним шагом: при пошаговом копировании любая запись
+                    # другого соединения начинает копию заново, а в WAL
+                    # чтение и так не мешает записи заказов
+                    src.backup(dst, pages=-1, name=schema,
+                               progress=lambda st, rem, tot: progress and progress(tot - rem, tot))
+                finally:
+                    dst.close()
+        finally:
+            src.close()
+        return dest
+
+    def snapshot(self, folder=BACKUP_DIR, keep=SNAPSHOT_KEEP, progress=None):
+        os.makedirs(folder, exist_ok=True)
+        name = os.path.splitext(os.path.basename(self.path))[0]
+        dest = os.path.join(folder, f"{name}-{datetime.now():%Y%m%d-%H%M%S}.db")
+        if os.path.exists(dest):
+            return dest
+        conn = sqlite3.connect(self.path)
+        try:
+            self.attach(conn)
+            conn.execute("VACUUM main INTO ?", (dest,))
+            conn.execute("VACUUM archive INTO ?", (self.archive_of(dest),))
+        finally:
+            conn.close()
+        self.rotate(folder, keep)
+        return dest
+
+    def snapshots(self, folder=BACKUP_DIR):
+        name = os.path.splitext(os.path.basename(self.path))[0]
+        return sorted((f for f in glob.glob(os.path.join(folder, f"{name}-*.db"))
+                       if not f.endswith("_archive.db")), reverse=True)
+
+    def rotate(self, folder=BACKUP_DIR, keep=SNAPSHOT_KEEP):
+        for old in self.snapshots(folder)[keep:]:
+            for path in (old, self.archive_of(old)):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def check(self, progress=None):
+        conn = sqlite3.connect(self.path)
+        try:
+            self.attach(conn)
+            rows = [f"{schema}: {r[0]}"
+                    for schema in ("main", "archive")
+                    for r in conn.execute(f"PRAGMA {schema}.integrity_check")]
+            conn.execute("PRAGMA optimize")
+        finally:
+            conn.close()
+        return "\n".join(rows)
+
+    def archive(self, cutoff, progress=None):
+        # Переносим продажи и закрытые заказы старше cutoff порциями.
+        # В WAL транзакция по двум файлам не атомарна при сбое, поэтому
+        # каждая порция — две транзакции по одному файлу: копия в архив
+        # (повтор безопасен), затем удаление из main только того, что
+        # уже есть в архиве
+        conn = sqlite3.connect(self.path)
+        try:
+            self.attach(conn)
+            marks = ",".join("?" * len(CLOSED_STATUSES))
+            jobs = [
+                ("sales", "sale_date < ?", (cutoff,)),
+                ("orders", f"order_date < ? AND status IN ({marks})",
+                 (cutoff, *CLOSED_STATUSES)),
+            ]
+            total = sum(conn.execute(f"SELECT COUNT(*) FROM main.{t} WHERE {w}", a)
+                        .fetchone()[0] for t, w, a in jobs)
+            moved = 0
+            for table, where, args in jobs:
+                cols = ",".join(r[1] for r in conn.execute(f"PRAGMA main.table_info({table})"))
+                batch = f"SELECT id FROM main.{table} WHERE {where} ORDER BY id LIMIT {ARCHIVE_BATCH}"
+                while True:
+                    with conn:
+                        conn.execute(f"""
+                        INSERT OR IGNORE INTO archive.{table}({cols})
+                        SELECT {cols} FROM main.{table} WHERE id IN ({batch})
+                        """, args)
+                    with conn:
+                        cur = conn.execute(f"""
+                        DELETE FROM main.{table} WHERE id IN ({batch})
+                        AND id IN (SELECT id FROM archive.{table})
+                        """, args)
+                    if not cur.rowcount:
+                        break
+                    moved += cur.rowcount
+                    if progress:
+                        progress(moved, total)
+        finally:
+            conn.close()
+        return f"перенесено записей: {moved}"
+
+class DbTask(QThread):
+    progress = pyqtSignal(int, int)
+    done = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, fn, *args):
+        super().__init__()
+        self.fn, self.args = fn, args
+
+    def run(self):
+        try:
+            self.done.emit(self.fn(*self.args, progress=self.progress.emit))
+        except Exception as e:
+            self.failed.emit(str(e))
+
+def mismatch_text(rows):
+    # Текст для результата Database.reconcile
+    if not rows:
+        return "остатки совпадают с журналом"
+    return "\n".join(f"{a} {n}: в карточке {q}, по журналу {l}"
+                     for a, n, q, l in rows)
+
 class CardWindow(QMainWindow):
     def make_card(self):
         card = QWidget()
@@ -275,10 +901,48 @@ class MainWindow(QMainWindow):
         
         self.current_page = None
         self.nav_buttons = []
+        self.tasks = []
         
         self.init_ui()
         self.show_start_page()
 
+        # Плановые снимки базы в фоне
+        self.poll_timer = QTimer(self)
+        self.poll_timer.timeout.connect(self.db.poll)
+        self.poll_timer.start(POLL_INTERVAL)
+
+        self.snapshot_timer = QTimer(self)
+        self.snapshot_timer.timeout.connect(self.scheduled_snapshot)
+        self.snapshot_timer.start(SNAPSHOT_INTERVAL)
+        last = self.db.snapshots()
+        if not last or datetime.now().timestamp() - os.path.getmtime(last[0]) > SNAPSHOT_INTERVAL / 1000:
+            self.scheduled_snapshot()
+
+    def closeEvent(self, event):
+        # Дожидаемся фоновых задач, иначе Qt оборвёт процесс
+        self.snapshot_timer.stop()
+        self.poll_timer.stop()
+        for task in list(self.tasks):
+            task.wait()
+        event.accept()
+
+    def run_task(self, fn, *args, done=None, failed=None, progress=None):
+        # Держим ссылку на поток, пока он не завершится
+        task = DbTask(fn, *args)
+        if done: task.done.connect(done)
+        if failed: task.failed.connect(failed)
+        if progress: task.progress.connect(progress)
+        task.finished.connect(lambda: self.tasks.remove(task))
+        self.tasks.append(task)
+        task.start()
+        return task
+
+    def scheduled_snapshot(self):
+        self.db.snapshot_stock()
+        self.run_task(self.db.snapshot, done=lambda _: self.pages["backup"].load(),
+                      failed=lambda msg: self.pages["backup"].failed(
+                          f"Плановый снимок не создан: {msg}"))
+
     def init_ui(self):
         # Создаем центральный виджет с горизонтальным layout
         central_widget = QWidget()
@@ -314,6 +978,7 @@ class MainWindow(QMainWindow):
             ("➕ Создать заказ", "create_order"),
             ("🛒 Список заказов", "orders"),
             ("📊 Отчёт по продажам", "report"),
+            ("💾 Резервные копии", "backup"),
         ]
 
         for text, page in nav_items:
@@ -337,6 +1002,7 @@ class MainWindow(QMainWindow):
             "create_order": CreateOrder(self.db, self),
             "orders": OrderList(self.db, self),
             "report": Report(self.db, self),
+            "backup": Backup(self.db, self),
         }
 
         # Добавляем страницы в контейнер
@@ -401,13 +1067,10 @@ class MainWindow(QMainWindow):
             btn.setStyleSheet(btn.styleSheet())  # Обновляем стиль
 
         # Показываем выбранную страницу
+        # Страницы обновляются сами по событиям базы (db.events)
         page = self.pages[page_name]
         self.page_container.setCurrentWidget(page)
         
-        # Обновляем данные на странице, если она поддерживает метод load
-        if hasattr(page, 'load'):
-            page.load()
-        
         self.setWindowTitle(f"Учёт товаров художника - {self.get_page_title(page_name)}")
 
     def get_page_title(self, page_name):
@@ -416,6 +1079,7 @@ class MainWindow(QMainWindow):
             "create_order": "Создание заказа",
             "orders": "Список заказов",
             "report": "Отчёт по продажам",
+            "backup": "Резервные копии",
         }
         return titles.get(page_name, "Учёт товаров")
 
@@ -424,6 +1088,7 @@ class CreateOrder(QWidget):
         super().__init__()
         self.db, self.parent_window = db, parent
         self.selected_product = None
+        self.scans = []
         self.init_ui()
 
     def init_ui(self):
@@ -435,6 +1100,15 @@ class CreateOrder(QWidget):
         title.setStyleSheet("font-size:20px;font-weight:bold;margin-bottom:20px;")
         layout.addWidget(title)
 
+        # Сканер: артикул или штрихкод + Enter сразу оформляет 1 шт.
+        self.scan = QLineEdit()
+        self.scan.setPlaceholderText("🔎 Сканируйте штрихкод или введите артикул")
+        self.scan.returnPressed.connect(self.on_scan)
+        layout.addWidget(self.scan)
+
+        self.scan_status = QLabel("")
+        layout.addWidget(self.scan_status)
+
         # Информация о товаре
         info_group = QGroupBox("Выберите товар")
         info_group.setStyleSheet("""
@@ -504,14 +1178,49 @@ class CreateOrder(QWidget):
 
         self.load_products()
 
+        ev = self.db.events
+        ev.product_changed.connect(self.patch_product)
+        ev.product_removed.connect(self.patch_product)
+        ev.reloaded.connect(self.load_products)
+
+    def patch_product(self, pid):
+        p = self.db.product_by_id(pid)
+        idx = self.product_combo.findData(pid)
+        if p and p[3] > 0:
+            if idx < 0:
+                self.load_products()
+                return
+            self.product_combo.setItemText(
+                idx, f"{p[1]} ({p[5]}) - {p[3]} шт. - {p[4]} ₽")
+            if idx == self.product_combo.currentIndex():
+                # Введённое количество не сбрасываем
+                self.show_product(p)
+        elif idx > 0:
+            # Иначе комбобокс сам выберет соседний товар
+            if idx == self.product_combo.currentIndex():
+                self.product_combo.setCurrentIndex(0)
+            self.product_combo.removeItem(idx)
+
     def load_products(self):
         products = self.db.available_products()
+        current = self.product_combo.currentData()
+        self.product_combo.blockSignals(True)
         self.product_combo.clear()
         self.product_combo.addItem("-- Выберите товар --", None)
         
         for product in products:
             text = f"{product[1]} ({product[5]}) - {product[3]} шт. - {product[4]} ₽"
             self.product_combo.addItem(text, product[0])
+        self.product_combo.blockSignals(False)
+        # Сохраняем выбор и количество, если товар ещё в наличии
+        idx = self.product_combo.findData(current)
+        self.product_combo.blockSignals(True)
+        self.product_combo.setCurrentIndex(max(idx, 0))
+        self.product_combo.blockSignals(False)
+        if idx > 0:
+            self.show_product(self.db.product_by_id(current))
+        else:
+            self.on_product_selected(0)
 
     def on_product_selected(self, index):
         if index == 0:
@@ -521,21 +1230,26 @@ class CreateOrder(QWidget):
             return
 
         pid = self.product_combo.itemData(index)
-        self.selected_product = self.db.product_by_id(pid)
-        
-        if self.selected_product:
-            self.lbl_name.setText(self.selected_product[1])
-            self.lbl_article.setText(self.selected_product[5])
-            self.lbl_category.setText(self.selected_product[2])
-            self.lbl_price.setText(f"{self.selected_product[4]} ₽")
-            self.lbl_available.setText(f"{self.selected_product[3]} шт.")
-            
-            self.quantity_spin.setMaximum(self.selected_product[3])
+        if self.show_product(self.db.product_by_id(pid)):
             self.quantity_spin.setValue(1)
-            
-            self.info_widget.show()
-            self.create_btn.setEnabled(True)
-            self.update_total()
+
+    def show_product(self, p):
+        # Подписи и максимум; текущее количество остаётся, если влезает
+        self.selected_product = p
+        if not p:
+            return False
+        self.lbl_name.setText(p[1])
+        self.lbl_article.setText(p[5])
+        self.lbl_category.setText(p[2])
+        self.lbl_price.setText(f"{p[4]} ₽")
+        self.lbl_available.setText(f"{p[3]} шт.")
+
+        self.quantity_spin.setMaximum(p[3])
+
+        self.info_widget.show()
+        self.create_btn.setEnabled(True)
+        self.update_total()
+        return True
 
     def update_total(self):
         if self.selected_product:
@@ -547,25 +1261,61 @@ class CreateOrder(QWidget):
             QMessageBox.warning(self, "Ошибка", "Выберите товар!")
             return
 
+        # add_order обновляет список товаров через события, запоминаем выбор
+        product, qty = self.selected_product, self.quantity_spin.value()
         try:
-            self.db.add_order(self.selected_product[0], self.quantity_spin.value())
-            QMessageBox.information(self, "Успех", 
-                f"Заказ успешно создан!\n"
-                f"Товар: {self.selected_product[1]}\n"
-                f"Количество: {self.quantity_spin.value()}\n"
-                f"Сумма: {self.selected_product[4] * self.quantity_spin.value():.2f} ₽")
-            
-            self.load_products()
+            self.db.add_order(product[0], qty)
             self.selected_product = None
             self.product_combo.setCurrentIndex(0)
             self.info_widget.hide()
             self.create_btn.setEnabled(False)
+            QMessageBox.information(self, "Успех", 
+                f"Заказ успешно создан!\n"
+                f"Товар: {product[1]}\n"
+                f"Количество: {qty}\n"
+                f"Сумма: {product[4] * qty:.2f} ₽")
             
         except ValueError as e:
             QMessageBox.critical(self, "Ошибка", str(e))
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", f"Произошла ошибка: {str(e)}")
 
+    def on_scan(self):
+        # Очищаем поле сразу, а заказы оформляем после того,
+        # как Qt разберёт всю пачку сканов из очереди событий
+        code = self.scan.text().strip()
+        self.scan.clear()
+        if not code:
+            return
+        if not self.scans:
+            QTimer.singleShot(0, self.flush_scans)
+        self.scans.append(code)
+
+    def flush_scans(self):
+        # Повторные сканы одного товара объединяем в один заказ
+        counts = {}
+        for code in self.scans:
+            counts[code] = counts.get(code, 0) + 1
+        self.scans = []
+
+        done, errors = [], []
+        for code, qty in counts.items():
+            pid = self.db.lookup(code)
+            if pid is None:
+                errors.append(f"{code}: не найден")
+                continue
+            try:
+                self.db.add_order(pid, qty)
+                done.append(f"{code} × {qty}")
+            except ValueError as e:
+                errors.append(f"{code}: {e}")
+            except Exception as e:
+                errors.append(f"{code}: ошибка: {e}")
+
+        self.scan_status.setStyleSheet(f"color:{'#dc2626' if errors else '#16a34a'};")
+        self.scan_status.setText("; ".join(
+            ([f"Добавлено: {', '.join(done)}"] if done else []) + errors))
+
     def load(self):
         self.load_products()
         self.selected_product = None
@@ -596,6 +1346,10 @@ class Catalog(QWidget):
         create_btn = QPushButton("➕ Создать")
         create_btn.clicked.connect(self.create)
         top_layout.addWidget(create_btn)
+
+        import_btn = QPushButton("📥 Импорт цен")
+        import_btn.clicked.connect(self.import_prices)
+        top_layout.addWidget(import_btn)
         
         layout.addLayout(top_layout)
 
@@ -609,41 +1363,81 @@ class Catalog(QWidget):
 
         self.load()
 
+        ev = self.db.events
+        ev.product_changed.connect(self.patch_product)
+        ev.product_removed.connect(self.remove_product)
+        ev.reloaded.connect(self.load)
+
     def load(self):
         self.table.setRowCount(0)
-        for i, p in enumerate(self.db.products(self.search.text()), 1):
-            r = self.table.rowCount()
-            self.table.insertRow(r)
-            self.table.setItem(r, 0, QTableWidgetItem(str(i)))
-            for c, v in enumerate(p[5::-1][:5][::-1], 1):
-                self.table.setItem(r, c, QTableWidgetItem(str(v)))
+        self.rows = {}  # id товара -> ячейка "№" его строки
+        for p in self.db.products(self.search.text()):
+            self.add_row(p)
+
+    def patch_product(self, pid):
+        item = self.rows.get(pid)
+        if item:
+            self.fill_row(item.row(), self.db.product_by_id(pid))
+        elif not self.search.text():
+            self.add_row(self.db.product_by_id(pid))
+        else:
+            self.load()
 
-            btns = QWidget()
-            l = QHBoxLayout(btns)
-            e = QPushButton("✏")
-            d = QPushButton("🗑")
-            e.clicked.connect(lambda _, x=p[0]: self.edit(x))
-            d.clicked.connect(lambda _, x=p[0]: self.delete(x))
-            l.addWidget(e)
-            l.addWidget(d)
-            l.setContentsMargins(0, 0, 0, 0)
-            self.table.setCellWidget(r, 6, btns)
+    def remove_product(self, pid):
+        item = self.rows.pop(pid, None)
+        if item:
+            r = item.row()
+            self.table.removeRow(r)
+            # Номера сдвигаются только у строк ниже удалённой
+            for i in range(r, self.table.rowCount()):
+                self.table.item(i, 0).setText(str(i + 1))
+
+    def fill_row(self, r, p):
+        for c, v in enumerate(p[5::-1][:5][::-1], 1):
+            self.table.setItem(r, c, QTableWidgetItem(str(v)))
+
+    def add_row(self, p):
+        r = self.table.rowCount()
+        self.table.insertRow(r)
+        item = QTableWidgetItem(str(r + 1))
+        self.table.setItem(r, 0, item)
+        self.rows[p[0]] = item
+        self.fill_row(r, p)
+
+        btns = QWidget()
+        l = QHBoxLayout(btns)
+        e = QPushButton("✏")
+        d = QPushButton("🗑")
+        e.clicked.connect(lambda _, x=p[0]: self.edit(x))
+        d.clicked.connect(lambda _, x=p[0]: self.delete(x))
+        l.addWidget(e)
+        l.addWidget(d)
+        l.setContentsMargins(0, 0, 0, 0)
+        self.table.setCellWidget(r, 6, btns)
 
     def edit(self, pid):
         p = self.db.fetch("SELECT * FROM products WHERE id=?", (pid,))[0]
         dlg = ProductDialog(self.db, p)
-        if dlg.exec():
-            self.load()
+        dlg.exec()
 
     def create(self):
         dlg = ProductDialog(self.db)
-        if dlg.exec():
-            self.load()
+        dlg.exec()
 
     def delete(self, pid):
         if QMessageBox.question(self, "Удалить", "Удалить товар?") == QMessageBox.StandardButton.Yes:
             self.db.delete_product(pid)
-            self.load()
+
+    def import_prices(self):
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Прайс поставщика", "", "CSV (*.csv)")
+        if not path:
+            return
+        try:
+            n = self.db.import_prices(path)
+            QMessageBox.information(self, "Импорт", f"Запланировано цен: {n}")
+        except Exception as e:
+            QMessageBox.warning(self, "Ошибка", str(e))
 
 class ProductDialog(QDialog):
     def __init__(self, db, data=None):
@@ -658,6 +1452,7 @@ class ProductDialog(QDialog):
         layout = QFormLayout(card)
 
         self.a = QLineEdit()
+        self.b = QLineEdit()
         self.n = QLineEdit()
         self.c = QComboBox()
         self.c.addItems(db.categories())
@@ -670,6 +1465,7 @@ class ProductDialog(QDialog):
 
         for t, w in [
             ("Артикул", self.a),
+            ("Штрихкод", self.b),
             ("Название", self.n),
             ("Категория", self.c),
             ("Количество", self.q),
@@ -697,6 +1493,7 @@ class ProductDialog(QDialog):
             self.q.setValue(data[3])
             self.p.setValue(data[4])
             self.d.setText(data[6])
+            self.b.setText(data[7] or "")
 
     def save(self):
         d = (
@@ -705,8 +1502,15 @@ class ProductDialog(QDialog):
             self.c.currentText(),
             self.q.value(),
             self.p.value(),
-            self.d.toPlainText()
+            self.d.toPlainText(),
+            self.b.text().strip() or None
         )
+        pid = self.data[0] if self.data else None
+        code = self.db.code_conflict(pid, (d[1], d[6]))
+        if code:
+            QMessageBox.warning(self, "Ошибка",
+                                f"Код {code} уже используется другим товаром")
+            return
         try:
             if self.data:
                 self.db.update_product(self.data[0], d)
@@ -741,18 +1545,61 @@ class OrderList(QWidget):
 
         self.load()
 
+        ev = self.db.events
+        ev.order_added.connect(self.add_order)
+        ev.order_changed.connect(self.patch_order)
+        ev.product_renamed.connect(self.patch_product)
+        ev.product_removed.connect(self.patch_product)
+        ev.reloaded.connect(self.load)
+
     def load(self):
         self.table.setRowCount(0)
-        for i, o in enumerate(self.db.orders(), 1):
-            r = self.table.rowCount()
-            self.table.insertRow(r)
-            self.table.setItem(r, 0, QTableWidgetItem(str(i)))
-            for c, v in enumerate(o, 1):
-                self.table.setItem(r, c, QTableWidgetItem(str(v)))
-
-            b = QPushButton("🔄")
-            b.clicked.connect(lambda _, x=o[0]: self.change_status(x))
-            self.table.setCellWidget(r, 6, b)
+        self.rows = {}  # id заказа -> ячейка "№" его строки
+        data = self.db.orders()
+        # Нумерация по убыванию: новый заказ сверху получает
+        # следующий номер, остальные строки не трогаем
+        self.count = len(data)
+        for i, o in enumerate(data):
+            self.add_row(i, o, self.count - i)
+
+    def add_row(self, r, o, number):
+        self.table.insertRow(r)
+        item = QTableWidgetItem(str(number))
+        item.setData(Qt.ItemDataRole.UserRole, o[6])
+        self.table.setItem(r, 0, item)
+        self.rows[o[0]] = item
+        self.fill_row(r, o)
+
+        b = QPushButton("🔄")
+        b.clicked.connect(lambda _, x=o[0]: self.change_status(x))
+        self.table.setCellWidget(r, 6, b)
+
+    def fill_row(self, r, o):
+        for c, v in enumerate(o[:6], 1):
+            self.table.setItem(r, c, QTableWidgetItem(str(v)))
+
+    def add_order(self, oid):
+        # Новые заказы идут первыми
+        if oid in self.rows:
+            return
+        self.count += 1
+        self.add_row(0, self.db.orders(oid)[0], self.count)
+
+    def patch_order(self, oid):
+        item = self.rows.get(oid)
+        if item:
+            self.fill_row(item.row(), self.db.orders(oid)[0])
+
+    def patch_product(self, pid):
+        # Только артикул и название, за один проход по заказам;
+        # товар хранится в UserRole ячейки "№"
+        p = self.db.product_by_id(pid)
+        article, name = (p[5], p[1]) if p else (None, None)
+        for item in self.rows.values():
+            if item.data(Qt.ItemDataRole.UserRole) == pid:
+                r = item.row()
+                self.table.setItem(r, 2, QTableWidgetItem(str(article)))
+                self.table.setItem(r, 3, QTableWidgetItem(str(name)))
 
     def change_status(self, oid):
         s, ok = QInputDialog.getItem(
@@ -762,7 +1609,6 @@ class OrderList(QWidget):
         )
         if ok:
             self.db.set_status(oid, s)
-            self.load()
 
     def create_new_order(self):
         self.parent_window.show_page("create_order")
@@ -810,11 +1656,50 @@ class Report(QWidget):
         self.table.setColumnWidth(0, 250)
         layout.addWidget(self.table)
 
+        # Динамика цены товара за период
+        trend_layout = QHBoxLayout()
+        trend_layout.addWidget(QLabel("Динамика цены:"))
+        # Товар ищем по артикулу или штрихкоду через индекс сканера,
+        # а не списком всех товаров
+        self.trend_code = QLineEdit()
+        self.trend_code.setPlaceholderText("Артикул или штрихкод")
+        self.trend_code.editingFinished.connect(self.load_trend)
+        trend_layout.addWidget(self.trend_code)
+        self.trend_name = QLabel("")
+        trend_layout.addWidget(self.trend_name, 1)
+        layout.addLayout(trend_layout)
+
+        self.trend = QTableWidget(0, 3)
+        self.trend.setHorizontalHeaderLabels(["С даты", "Цена", "Закупка"])
+        self.trend.setMaximumHeight(150)
+        layout.addWidget(self.trend)
+
         self.load()
 
+        self.db.events.sale_added.connect(self.add_sale)
+        self.db.events.product_renamed.connect(lambda _: self.load_trend())
+        self.db.events.reloaded.connect(self.load)
+
+    def update_total(self, s, e):
+        self.total.setText(f"Итог: {self.db.total(s, e):.2f} ₽   "
+                           f"Маржа: {self.db.margin(s, e):.2f} ₽")
+
+    def add_sale(self, sid):
+        # Дописываем продажу, если она попадает в сформированный период
+        sale = self.db.sale(sid)
+        s, e = self.period
+        if not sale or not s <= sale[0] <= e:
+            return
+        r = self.table.rowCount()
+        self.table.insertRow(r)
+        for c, v in enumerate(sale[1:]):
+            self.table.setItem(r, c, QTableWidgetItem(str(v)))
+        self.update_total(s, e)
+
     def load(self):
         s = self.s.date().toString("yyyy-MM-dd")
         e = self.e.date().toString("yyyy-MM-dd")
+        self.period = (s, e)
         data = self.db.report(s, e)
         
         self.table.setRowCount(len(data))
@@ -822,9 +1707,146 @@ class Report(QWidget):
             for c, v in enumerate(row):
                 self.table.setItem(r, c, QTableWidgetItem(str(v)))
                 
-        self.total.setText(f"Итог: {self.db.total(s, e):.2f} ₽")
+        self.update_total(s, e)
+        self.load_trend()
+
+    def load_trend(self):
+        code = self.trend_code.text()
+        p = self.db.product_by_id(self.db.lookup(code)) if code.strip() else None
+        self.trend_name.setText(p[1] if p else "товар не найден" if code.strip() else "")
+        data = self.db.price_trend(p[0], *self.period) if p else []
+        self.trend.setRowCount(len(data))
+        for r, (date, price, cost) in enumerate(data):
+            for c, v in enumerate((date if date != "0000-01-01" else "—",
+                                   price, "—" if cost is None else cost)):
+                self.trend.setItem(r, c, QTableWidgetItem(str(v)))
+
+class Backup(QWidget):
+    def __init__(self, db, parent):
+        super().__init__()
+        self.db, self.parent_window = db, parent
+        self.init_ui()
+
+    def init_ui(self):
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(20, 20, 20, 20)
+
+        # Кнопки обслуживания
+        btn_layout = QHBoxLayout()
+        self.buttons = []
+        for text, fn in [
+            ("💾 Создать копию", self.backup),
+            ("📸 Снимок", self.snapshot),
+            ("🩺 Проверить базу", self.check),
+            ("📋 Сверка остатков", self.reconcile),
+        ]:
+            b = QPushButton(text)
+            b.clicked.connect(fn)
+            btn_layout.addWidget(b)
+            self.buttons.append(b)
+        layout.addLayout(btn_layout)
+
+        # Архивирование старых продаж и закрытых заказов
+        archive_layout = QHBoxLayout()
+        archive_layout.addWidget(QLabel("Архивировать до:"))
+        self.cutoff = QDateEdit(QDate.currentDate().addYears(-1))
+        self.cutoff.setCalendarPopup(True)
+        archive_layout.addWidget(self.cutoff)
+        archive_layout.addStretch()
+        b = QPushButton("🗄 В архив")
+        b.clicked.connect(self.archive)
+        archive_layout.addWidget(b)
+        self.buttons.append(b)
+        layout.addLayout(archive_layout)
+
+        self.bar = QProgressBar()
+        self.bar.setValue(0)
+        layout.addWidget(self.bar)
+
+        self.status = QLabel("-")
+        layout.addWidget(self.status)
+
+        # Список снимков
+        self.table = QTableWidget(0, 3)
+        self.table.setHorizontalHeaderLabels(["Файл", "Размер, КБ", "Дата"])
+        self.table.setColumnWidth(0, 300)
+        layout.addWidget(self.table)
+
+        self.load()
+
+    def load(self):
+        data = [
+            (f, os.path.getsize(f) // 1024,
+             datetime.fromtimestamp(os.path.getmtime(f)).strftime("%Y-%m-%d %H:%M"))
+            for f in self.db.snapshots()
+        ]
+        self.table.setRowCount(len(data))
+        for r, row in enumerate(data):
+            for c, v in enumerate(row):
+                self.table.setItem(r, c, QTableWidgetItem(str(v)))
+
+    def busy(self, on):
+        for b in self.buttons:
+            b.setEnabled(not on)
+
+    def run(self, text, fn, *args, done=None):
+        self.busy(True)
+        self.bar.setValue(0)
+        self.status.setText(text)
+        self.parent_window.run_task(fn, *args, done=done or self.done,
+                                    failed=self.failed, progress=self.step)
+
+    def step(self, done, total):
+        self.bar.setMaximum(total)
+        self.bar.setValue(done)
+
+    def done(self, result):
+        self.busy(False)
+        self.bar.setValue(self.bar.maximum())
+        self.status.setText(f"Готово: {result}")
+        self.load()
+
+    def failed(self, msg):
+        self.busy(False)
+        self.status.setText("-")
+        QMessageBox.critical(self, "Ошибка", msg)
+
+    def backup(self):
+        dest, _ = QFileDialog.getSaveFileName(
+            self, "Резервная копия", f"shop-{datetime.now():%Y%m%d-%H%M%S}.db",
+            "SQLite (*.db)")
+        if dest:
+            self.run("Копирование...", self.db.backup, dest)
+
+    def snapshot(self):
+        self.run("Создание снимка...", self.db.snapshot)
+
+    def check(self):
+        self.run("Проверка базы...", self.db.check)
+
+    def reconcile(self):
+        self.run("Сверка остатков...", self.db.reconcile,
+                 done=lambda rows: self.done(mismatch_text(rows)))
+
+    def archive(self):
+        cutoff = self.cutoff.date().toString("yyyy-MM-dd")
+        if QMessageBox.question(
+            self, "Архив",
+            f"Перенести продажи и закрытые заказы до {cutoff} в архив?"
+        ) == QMessageBox.StandardButton.Yes:
+            self.run("Архивирование...", self.db.archive, cutoff)
 
 def main():
+    # python main.py --reconcile: сверка остатков без интерфейса
+    if "--reconcile" in sys.argv:
+        # Не создаём пустую базу, если запустили не из той папки
+        if not os.path.exists(DB):
+            print(f"База {DB} не найдена", file=sys.stderr)
+            sys.exit(2)
+        rows = Database().reconcile()
+        print(mismatch_text(rows))
+        sys.exit(1 if rows else 0)
+
     app = QApplication(sys.argv)
     w = MainWindow()
     w.show()